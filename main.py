@@ -4,16 +4,21 @@ from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from webdriver_manager.chrome import ChromeDriverManager
+from selenium.common.exceptions import TimeoutException
 import time
-import pyautogui
-import base64
-from PIL import Image
-import io
-import anthropic
+import json
+import re
+import hashlib
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import binascii
 import os
 from dotenv import load_dotenv
 import logging
+import logging.handlers
+import queue
+import atexit
 import sys
 from datetime import datetime
 import httpx
@@ -31,15 +36,22 @@ if not os.path.exists('screenshots'):
 timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
 log_file = f"logs/expedia_bot_{timestamp}.log"
 
-# Configure logging
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(log_file),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
+# Configure logging. Records go through a queue so file and console writes
+# happen on the listener thread instead of blocking the navigation loop
+log_formatter = logging.Formatter('%(asctime)s - %(threadName)s - %(levelname)s - %(message)s')
+log_handlers = [
+    logging.FileHandler(log_file),
+    logging.StreamHandler(sys.stdout)
+]
+for handler in log_handlers:
+    handler.setFormatter(log_formatter)
+log_queue = queue.Queue(-1)
+log_listener = logging.handlers.QueueListener(log_queue, *log_handlers)
+log_listener.start()
+atexit.register(log_listener.stop)
+root_logger = logging.getLogger()
+root_logger.setLevel(logging.DEBUG)
+root_logger.addHandler(logging.handlers.QueueHandler(log_queue))
 logger = logging.getLogger(__name__)
 
 # Log the start of the session
@@ -49,15 +61,120 @@ logger.info(f"Starting new session. Log file: {log_file}")
 load_dotenv()
 logger.info("Environment variables loaded")
 
+# Screenshots are downscaled and JPEG-encoded by Chrome before being sent to
+# Claude, since image tokens scale with pixel count
+SCREENSHOT_MAX_SIZE = (1024, 1024)
+SCREENSHOT_JPEG_QUALITY = 60
+
+# Guidance replies are a short list of commands, so a fast model and a small
+# token budget are enough
+CLAUDE_MODEL = "claude-3-5-haiku-latest"
+CLAUDE_MAX_TOKENS = 300
+MAX_PLAN_ACTIONS = 5
+
+# Static instructions sent ahead of every page description
+GUIDANCE_PROMPT = """I'm trying to navigate Expedia.com to find the best rated hotel for the search described below.
+Step by Step example is:
+Step1: click on stays,
+Step2: close any pop ups on the screen. 
+Step3: Type in the city. Step4: Enter the dates
+Step4: Click on search
+Step5: Optionally sign in as Sumant
+You will get either a JSON list of the interactive elements on the current page, each with its id, role, name and any current value or focused/checked/expanded/selected state, or a screenshot of the page.
+Please analyze the page and tell me what I should do next. Return only a JSON array of up to 5 actions, each {"op": ..., "arg": ...}, where op is 'CLICK' (arg is an element's id, or an xpath or css selector), 'TYPE' (arg is the text to type into the focused element), 'WAIT' (arg is seconds) or 'DONE' if we've reached the hotel page.
+Stop the list at the first action whose outcome you can't predict from this page.
+"""
+
+# Per-search details sent after the static prompt
+SEARCH_PROMPT = "Search: the best rated hotel in {city} for {check_in} to {check_out}."
+DEFAULT_QUERY = {"city": "Seattle", "check_in": "April 17th", "check_out": "April 20"}
+
+# Shared Anthropic client, created on first use and reused by every worker so
+# HTTP keep-alive connections survive across calls
+_client = None
+_client_lock = threading.Lock()
+
+# Each worker thread keeps its own Chrome session for reuse across searches
+_local = threading.local()
+_drivers = []
+_drivers_lock = threading.Lock()
+
+# Parallel browser workers, and a cap on Claude requests in flight across
+# all of them to stay inside the API rate limit. Keep the cap below
+# MAX_WORKERS, since each worker only has one request in flight at a time
+MAX_WORKERS = 8
+MAX_CONCURRENT_CLAUDE_CALLS = int(os.getenv("MAX_CONCURRENT_CLAUDE_CALLS", "4"))
+_claude_slots = threading.BoundedSemaphore(MAX_CONCURRENT_CLAUDE_CALLS)
+
+# Chromedriver path, resolved once per process. Set CHROMEDRIVER_PATH to
+# skip webdriver_manager's network check entirely
+_driver_path = os.getenv("CHROMEDRIVER_PATH") or None
+_driver_path_lock = threading.Lock()
+
+# Debug screenshots are only written when SCREENSHOT_DEBUG=1, off the
+# navigation thread, keeping just the most recent few on disk
+SCREENSHOT_DEBUG = os.getenv("SCREENSHOT_DEBUG") == "1"
+SCREENSHOT_DEBUG_KEEP = 20
+_debug_screenshots = deque()
+_debug_writer = ThreadPoolExecutor(max_workers=1)
+
+# Upper bound on WAIT guidance, the model tends to over-estimate
+MAX_WAIT_SECONDS = 5
+
+# Fallback for replies that are a single command such as 'CLICK: #search-button'
+GUIDANCE_RE = re.compile(r'^(CLICK|TYPE|WAIT|DONE)\b\s*:?\s*(.*)$', re.DOTALL)
+
+# Parses a JSON plan while ignoring any text the model adds around it, such
+# as a leading sentence or markdown code fences
+JSON_DECODER = json.JSONDecoder()
+PLAN_START_RE = re.compile(r'\[\s*[{\]]')
+
+# Accessibility roles worth offering to Claude as click or type targets
+INTERACTIVE_ROLES = frozenset({
+    'button', 'link', 'textbox', 'searchbox', 'combobox', 'checkbox',
+    'radio', 'menuitem', 'tab', 'option', 'switch', 'gridcell'
+})
+MAX_PAGE_ELEMENTS = 150
+
+# Element state passed along so Claude can see focus and what was typed
+ELEMENT_STATE_PROPERTIES = ('focused', 'checked', 'expanded', 'selected')
+
+# How many unchanged frames in a row we skip before asking Claude anyway
+MAX_UNCHANGED_SKIPS = 3
+
+# Give up on a search after this many passes through the navigation loop
+MAX_NAVIGATION_STEPS = 50
+
+def get_driver_path():
+    global _driver_path
+    with _driver_path_lock:
+        if _driver_path is None:
+            from webdriver_manager.chrome import ChromeDriverManager
+            logger.info("Resolving chromedriver with webdriver_manager")
+            _driver_path = ChromeDriverManager().install()
+        return _driver_path
+
 def setup_driver():
     logger.info("Setting up Chrome driver")
     try:
         # Set up Chrome options
         chrome_options = Options()
-        chrome_options.add_argument("--start-maximized")
+        # Headless with a fixed viewport keeps screenshots small and the
+        # same size on every host
+        chrome_options.add_argument("--headless=new")
+        chrome_options.add_argument("--window-size=1280,800")
+        chrome_options.add_argument("--hide-scrollbars")
+        # Keep screenshots at 1x so HiDPI hosts don't multiply the pixel count
+        chrome_options.add_argument("--force-device-scale-factor=1")
+        # Trim background work that slows page loads
+        chrome_options.add_argument("--disable-dev-shm-usage")
+        chrome_options.add_argument("--disable-extensions")
+        chrome_options.add_argument("--no-first-run")
+        chrome_options.add_argument("--disable-background-networking")
+        chrome_options.add_argument("--disable-features=Translate,BackForwardCache")
         
         # Set up the Chrome driver
-        service = Service(ChromeDriverManager().install())
+        service = Service(get_driver_path())
         driver = webdriver.Chrome(service=service, options=chrome_options)
         logger.info("Chrome driver setup successful")
         return driver
@@ -65,84 +182,248 @@ def setup_driver():
         logger.error(f"Failed to setup Chrome driver: {str(e)}")
         raise
 
+def get_driver():
+    driver = getattr(_local, 'driver', None)
+    if driver is None:
+        driver = _local.driver = setup_driver()
+        with _drivers_lock:
+            _drivers.append(driver)
+    else:
+        # Start each logical session from a clean slate
+        logger.info("Reusing Chrome driver, clearing cookies")
+        driver.delete_all_cookies()
+    return driver
+
+def discard_driver():
+    # Drop this worker's driver so the next search starts a fresh session,
+    # used when the current one may have died
+    driver = getattr(_local, 'driver', None)
+    if driver is None:
+        return
+    _local.driver = None
+    with _drivers_lock:
+        if driver in _drivers:
+            _drivers.remove(driver)
+    logger.info("Discarding Chrome driver")
+    try:
+        driver.quit()
+    except Exception as e:
+        logger.warning("Failed to quit discarded Chrome driver: %s", e)
+
+def close_drivers():
+    with _drivers_lock:
+        while _drivers:
+            logger.info("Closing browser")
+            _drivers.pop().quit()
+
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            # Get API key from environment variable
+            api_key = os.getenv('ANTHROPIC_API_KEY')
+            if not api_key:
+                logger.error("ANTHROPIC_API_KEY not found in environment variables")
+                raise ValueError("ANTHROPIC_API_KEY not found in environment variables")
+            
+            import anthropic
+            logger.debug("Initializing Anthropic client")
+            _client = anthropic.Anthropic(
+                api_key=api_key,
+                timeout=60.0,  # Increased timeout to 60 seconds
+                http_client=httpx.Client(
+                    timeout=60.0,
+                    limits=httpx.Limits(max_keepalive_connections=MAX_CONCURRENT_CLAUDE_CALLS)
+                )
+            )
+        return _client
+
+def save_debug_screenshot(screenshot):
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    local_path = f"screenshots/screenshot_{timestamp}.jpg"
+    try:
+        with open(local_path, 'wb') as f:
+            f.write(screenshot)
+        logger.info("Screenshot saved locally at: %s", local_path)
+        
+        # Drop the oldest screenshot once we are over the limit
+        _debug_screenshots.append(local_path)
+        if len(_debug_screenshots) > SCREENSHOT_DEBUG_KEEP:
+            os.unlink(_debug_screenshots.popleft())
+    except OSError as e:
+        logger.error(f"Failed to save debug screenshot: {str(e)}")
+
 def take_screenshot(driver):
     logger.debug("Taking screenshot")
     try:
-        # Take screenshot using Selenium
-        screenshot = driver.get_screenshot_as_png()
-        logger.debug(f"Screenshot taken, size: {len(screenshot)} bytes")
+        # Capture the visible viewport, scaled down to fit SCREENSHOT_MAX_SIZE
+        viewport = driver.execute_cdp_cmd("Page.getLayoutMetrics", {})["cssLayoutViewport"]
+        width, height = viewport["clientWidth"], viewport["clientHeight"]
+        if width <= 0 or height <= 0:
+            raise ValueError(f"Viewport has no visible area: {width}x{height}")
+        scale = min(1.0, SCREENSHOT_MAX_SIZE[0] / width, SCREENSHOT_MAX_SIZE[1] / height)
         
-        # Convert to PIL Image
-        image = Image.open(io.BytesIO(screenshot))
-        logger.debug(f"Image converted to PIL format, size: {image.size}")
+        # Have Chrome downscale and encode the JPEG itself over CDP, so
+        # the image never has to be decoded and re-encoded in Python
+        result = driver.execute_cdp_cmd("Page.captureScreenshot", {
+            "format": "jpeg",
+            "quality": SCREENSHOT_JPEG_QUALITY,
+            "clip": {
+                "x": viewport["pageX"],
+                "y": viewport["pageY"],
+                "width": width,
+                "height": height,
+                "scale": scale
+            }
+        })
+        base64_image = result["data"]
+        logger.debug("Screenshot taken, base64 length: %d, scale: %.2f", len(base64_image), scale)
         
         # Save screenshot locally for debugging
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        local_path = f"screenshots/screenshot_{timestamp}.png"
-        image.save(local_path)
-        logger.info(f"Screenshot saved locally at: {local_path}")
-        
-        # Convert to base64
-        buffered = io.BytesIO()
-        image.save(buffered, format="PNG")
-        base64_image = base64.b64encode(buffered.getvalue()).decode()
-        logger.debug(f"Image converted to base64, length: {len(base64_image)}")
+        if SCREENSHOT_DEBUG:
+            _debug_writer.submit(save_debug_screenshot, binascii.a2b_base64(base64_image))
         
         return base64_image
     except Exception as e:
         logger.error(f"Failed to take screenshot: {str(e)}")
         raise
 
+def extract_page_elements(driver):
+    logger.debug("Extracting interactive elements from the accessibility tree")
+    tree = driver.execute_cdp_cmd("Accessibility.getFullAXTree", {})
+    nodes = [
+        node for node in tree.get("nodes", [])
+        if not node.get("ignored")
+        and node.get("role", {}).get("value") in INTERACTIVE_ROLES
+        and node.get("name", {}).get("value")
+        and node.get("backendDOMNodeId")
+    ][:MAX_PAGE_ELEMENTS]
+    
+    # Claude refers to elements by their backend node id, which is only
+    # turned into a selector for the element it actually clicks
+    elements = []
+    for node in nodes:
+        element = {
+            "id": node["backendDOMNodeId"],
+            "role": node["role"]["value"],
+            "name": node["name"]["value"]
+        }
+        value = node.get("value", {}).get("value")
+        if value not in (None, ""):
+            element["value"] = value
+        for prop in node.get("properties", []):
+            if prop.get("name") in ELEMENT_STATE_PROPERTIES:
+                element[prop["name"]] = prop.get("value", {}).get("value")
+        elements.append(element)
+    logger.debug("Extracted %d interactive elements", len(elements))
+    return elements
+
+def tag_element(driver, element_id):
+    # Mark the DOM node behind an accessibility tree id so it can be found
+    # with a plain CSS selector
+    driver.execute_cdp_cmd("DOM.getDocument", {"depth": 0})
+    node_ids = driver.execute_cdp_cmd("DOM.pushNodesByBackendIdsToFrontend", {
+        "backendNodeIds": [int(element_id)]
+    })["nodeIds"]
+    if not node_ids or not node_ids[0]:
+        raise ValueError(f"Element {element_id} is no longer in the page")
+    driver.execute_cdp_cmd("DOM.setAttributeValue", {
+        "nodeId": node_ids[0],
+        "name": "data-bot-id",
+        "value": str(element_id)
+    })
+    return f'[data-bot-id="{element_id}"]'
+
+def capture_page(driver):
+    # Describe the page as text where possible, since that is far cheaper for
+    # Claude than a screenshot. Returns the kind of capture and its payload
+    try:
+        elements = extract_page_elements(driver)
+    except Exception as e:
+        logger.warning("Failed to extract page elements: %s", e)
+        elements = []
+    if elements:
+        return "text", json.dumps(elements, separators=(',', ':'))
+    
+    # Fall back to vision when the page has nothing usable in its text form
+    logger.info("No interactive elements found, falling back to screenshot")
+    return "image", take_screenshot(driver)
+
+def build_page_content(kind, payload):
+    # Wrap a capture in the content block sent to Claude
+    if kind == "text":
+        return {"type": "text", "text": payload}
+    return {
+        "type": "image",
+        "source": {
+            "type": "base64",
+            "media_type": "image/jpeg",
+            "data": payload
+        }
+    }
+
+def complete_guidance(text):
+    # Returns the guidance once enough of the streamed reply has arrived to
+    # act on, or None if more text is still needed
+    found = find_plan(text)
+    if found is not None:
+        return text[:found[1]]
+    if PLAN_START_RE.search(text):
+        # A plan may have started, but no array has closed into valid JSON yet
+        return None
+    
+    # A single 'OP: arg' command is complete at the end of its first line
+    stripped = text.lstrip()
+    if '\n' in stripped and GUIDANCE_RE.match(stripped):
+        return stripped.split('\n', 1)[0]
+    return None
+
 @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
-def get_claude_guidance(image_base64):
+def get_claude_guidance(page, query):
     logger.info("Getting guidance from Claude")
     try:
-        # Get API key from environment variable
-        api_key = os.getenv('ANTHROPIC_API_KEY')
-        if not api_key:
-            logger.error("ANTHROPIC_API_KEY not found in environment variables")
-            raise ValueError("ANTHROPIC_API_KEY not found in environment variables")
-        
-        logger.debug("Initializing Anthropic client")
-        client = anthropic.Anthropic(
-            api_key=api_key,
-            timeout=60.0  # Increased timeout to 60 seconds
-        )
+        client = get_client()
         
         logger.debug("Sending request to Claude")
         try:
-            message = client.messages.create(
-                model="claude-3-opus-20240229",
-                max_tokens=1000,
+            # Hold a slot for the whole request so parallel workers never
+            # exceed the concurrency cap
+            with _claude_slots, client.messages.stream(
+                model=CLAUDE_MODEL,
+                max_tokens=CLAUDE_MAX_TOKENS,
                 messages=[{
                     "role": "user",
                     "content": [
                         {
                             "type": "text",
-                            "text": """I'm trying to navigate Expedia.com to find the best rated hotel in Seattle for April 17th to April 20.
-                            Step by Step example is:
-                            Step1: click on stays,
-                            Step2: close any pop ups on the screen. 
-                            Step3: Type in Seattle. Step4: Enter the dates
-                            Step4: Click on search
-                            Step5: Optionally sign in as Sumant
-                            Please analyze this screenshot and tell me what element I should click next. Return the response in this format: 'CLICK: [xpath or css selector]' or 'TYPE: [text to type]' or 'WAIT: [seconds]' or 'DONE' if we've reached the hotel page.
-                            """
+                            "text": GUIDANCE_PROMPT,
+                            # Identical on every call, so let Anthropic cache it
+                            "cache_control": {"type": "ephemeral"}
                         },
                         {
-                            "type": "image",
-                            "source": {
-                                "type": "base64",
-                                "media_type": "image/png",
-                                "data": image_base64
-                            }
-                        }
+                            "type": "text",
+                            "text": SEARCH_PROMPT.format(**query)
+                        },
+                        {
+                            "type": "text",
+                            "text": "Here are the interactive elements on the current page:"
+                            if page["type"] == "text" else "Here is the current screenshot:"
+                        },
+                        page
                     ]
                 }]
-            )
+            ) as stream:
+                # Stop reading as soon as there is a usable plan. Leaving the
+                # context manager closes the stream
+                guidance = ""
+                for text in stream.text_stream:
+                    guidance += text
+                    complete = complete_guidance(guidance)
+                    if complete is not None:
+                        guidance = complete
+                        break
             
-            guidance = message.content[0].text
-            logger.info(f"Received guidance from Claude: {guidance}")
+            logger.info("Received guidance from Claude: %s", guidance)
             return guidance
         except httpx.TimeoutException as e:
             logger.error(f"Request to Claude timed out after 60 seconds: {str(e)}")
@@ -158,11 +439,102 @@ def get_claude_guidance(image_base64):
         logger.error(f"Failed to get Claude guidance: {str(e)}")
         raise
 
-def find_best_seattle_hotel():
-    logger.info("Starting hotel search process")
-    driver = None
+def wait_ready(driver, timeout=10):
+    # Poll until the document has finished loading instead of sleeping blindly
+    WebDriverWait(driver, timeout, poll_frequency=0.1).until(
+        lambda d: d.execute_script("return document.readyState") == "complete"
+    )
+
+def get_locator(selector):
+    # XPath expressions start with '//' or '(/', anything else is treated as CSS
+    if selector.startswith(('//', '(/')):
+        return (By.XPATH, selector)
+    return (By.CSS_SELECTOR, selector)
+
+def handle_click(driver, wait, selector):
+    logger.info("Attempting to click element with selector: %s", selector)
+    try:
+        # Bare numbers are element ids from the accessibility tree
+        if selector.isdigit():
+            selector = tag_element(driver, selector)
+        
+        # Try to find and click the element
+        element = wait.until(EC.element_to_be_clickable(get_locator(selector)))
+        element.click()
+        logger.info("Successfully clicked element")
+    except Exception as e:
+        logger.error(f"Failed to click element: {str(e)}")
+        raise
+    
+    # The click itself worked, so a slow page load should not fail the plan
+    try:
+        wait_ready(driver)
+    except TimeoutException:
+        logger.warning("Timed out waiting for the page to be ready after click")
+
+def handle_type(driver, wait, text):
+    logger.info("Attempting to type text: %s", text)
+    try:
+        # Find the active element and type
+        active_element = driver.switch_to.active_element
+        active_element.send_keys(text)
+        logger.info("Successfully typed text")
+    except Exception as e:
+        logger.error(f"Failed to type text: {str(e)}")
+        raise
+
+def handle_wait(driver, wait, seconds):
+    seconds = max(0.0, min(float(seconds), MAX_WAIT_SECONDS))
+    logger.info("Waiting for %s seconds", seconds)
+    time.sleep(seconds)
+
+def handle_done(driver, wait, _):
+    logger.info("Reached the hotel page successfully!")
+    return True
+
+# Handlers return True once navigation is complete
+GUIDANCE_HANDLERS = {
+    'CLICK': handle_click,
+    'TYPE': handle_type,
+    'WAIT': handle_wait,
+    'DONE': handle_done,
+}
+
+def find_plan(text):
+    # Returns (actions, end) for the first complete JSON array of actions in
+    # text, or None if there is none yet. Earlier brackets that are not valid
+    # JSON, such as a restated format, are skipped
+    for match in PLAN_START_RE.finditer(text):
+        try:
+            return JSON_DECODER.raw_decode(text, match.start())
+        except ValueError:
+            continue
+    return None
+
+def parse_plan(guidance):
+    # Claude should reply with a JSON array of {"op", "arg"} actions
+    found = find_plan(guidance)
+    if found is not None:
+        plan = []
+        for action in found[0]:
+            op = str(action.get('op', '')).upper() if isinstance(action, dict) else ''
+            if op not in GUIDANCE_HANDLERS:
+                logger.warning("Dropping malformed action: %s", action)
+                continue
+            plan.append((op, str(action.get('arg', '')).strip()))
+        return plan[:MAX_PLAN_ACTIONS]
+    
+    # Otherwise accept a single 'OP: arg' command
+    match = GUIDANCE_RE.match(guidance.strip())
+    if match:
+        return [(match.group(1), match.group(2).strip())]
+    return []
+
+def find_best_hotel(query=DEFAULT_QUERY):
+    logger.info(f"Starting hotel search process for {query['city']}")
     try:
-        driver = setup_driver()
+        driver = get_driver()
+        wait = WebDriverWait(driver, 10)
         
         # Navigate to Expedia
         logger.info("Navigating to Expedia.com")
@@ -170,72 +542,85 @@ def find_best_seattle_hotel():
         
         # Wait for page to load
         logger.info("Waiting for page to load")
-        time.sleep(5)
+        wait_ready(driver)
         
-        while True:
+        prev_hash = None
+        unchanged_skips = 0
+        for _ in range(MAX_NAVIGATION_STEPS):
             logger.debug("Starting new iteration of navigation loop")
             try:
-                # Take screenshot and get Claude's guidance
-                screenshot = take_screenshot(driver)
-                guidance = get_claude_guidance(screenshot)
+                # Capture the current page
+                kind, payload = capture_page(driver)
                 
-                if guidance.startswith('CLICK:'):
-                    # Extract the selector from the guidance
-                    selector = guidance.replace('CLICK:', '').strip()
-                    logger.info(f"Attempting to click element with selector: {selector}")
-                    try:
-                        # Try to find and click the element
-                        element = WebDriverWait(driver, 10).until(
-                            EC.element_to_be_clickable((By.XPATH if '//' in selector else By.CSS_SELECTOR, selector))
-                        )
-                        element.click()
-                        logger.info("Successfully clicked element")
-                    except Exception as e:
-                        logger.error(f"Failed to click element: {str(e)}")
+                # Skip Claude while the page looks exactly as it did last time
+                page_hash = hashlib.blake2b(payload.encode('utf-8'), digest_size=8).digest()
+                if page_hash == prev_hash and unchanged_skips < MAX_UNCHANGED_SKIPS:
+                    unchanged_skips += 1
+                    logger.info("Page unchanged since last guidance, waiting")
+                    time.sleep(1)
+                    continue
+                prev_hash = page_hash
+                unchanged_skips = 0
                 
-                elif guidance.startswith('TYPE:'):
-                    # Extract the text to type
-                    text = guidance.replace('TYPE:', '').strip()
-                    logger.info(f"Attempting to type text: {text}")
-                    try:
-                        # Find the active element and type
-                        active_element = driver.switch_to.active_element
-                        active_element.send_keys(text)
-                        logger.info("Successfully typed text")
-                    except Exception as e:
-                        logger.error(f"Failed to type text: {str(e)}")
+                # Get Claude's guidance
+                page = build_page_content(kind, payload)
+                guidance = get_claude_guidance(page, query)
                 
-                elif guidance.startswith('WAIT:'):
-                    # Extract the number of seconds to wait
-                    seconds = float(guidance.replace('WAIT:', '').strip())
-                    logger.info(f"Waiting for {seconds} seconds")
-                    time.sleep(seconds)
+                plan = parse_plan(guidance)
+                if not plan:
+                    logger.warning("Could not parse guidance: %s", guidance)
                 
-                elif guidance == 'DONE':
-                    logger.info("Reached the hotel page successfully!")
+                # Run the plan in order, asking Claude again once it is
+                # exhausted or as soon as an action fails
+                done = False
+                for op, arg in plan:
+                    try:
+                        done = GUIDANCE_HANDLERS[op](driver, wait, arg)
+                    except Exception as e:
+                        logger.warning("Abandoning remaining plan after failed %s: %s", op, e)
+                        break
+                    if done:
+                        break
+                if done:
                     break
                 
             except Exception as e:
-                logger.error(f"Error in navigation loop: {str(e)}")
+                logger.error("Error in navigation loop: %s", e)
                 time.sleep(5)  # Wait before retrying
                 continue
-            
-            # Small delay between actions
-            time.sleep(1)
+        else:
+            raise RuntimeError(f"Gave up after {MAX_NAVIGATION_STEPS} navigation steps")
         
     except Exception as e:
         logger.error(f"An error occurred in main process: {str(e)}")
+        # The browser may be why we failed, so don't reuse it
+        discard_driver()
         raise
-    finally:
-        if driver:
-            logger.info("Closing browser")
-            driver.quit()
+
+def run_searches(queries, max_workers=MAX_WORKERS):
+    # Each worker thread drives its own browser, so several searches can be
+    # waiting on Claude at once
+    logger.info(f"Running {len(queries)} searches on up to {max_workers} workers")
+    failed = []
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="search") as pool:
+        futures = [(query, pool.submit(find_best_hotel, query)) for query in queries]
+        for query, future in futures:
+            try:
+                future.result()
+                logger.info(f"Search for {query['city']} completed successfully")
+            except Exception as e:
+                logger.error(f"Search for {query['city']} failed: {str(e)}")
+                failed.append(query)
+    return failed
 
 if __name__ == "__main__":
     try:
         logger.info("Starting Expedia hotel search bot")
-        find_best_seattle_hotel()
+        if run_searches([DEFAULT_QUERY]):
+            sys.exit(1)
         logger.info("Bot execution completed successfully")
     except Exception as e:
         logger.error(f"Bot execution failed: {str(e)}")
         sys.exit(1)
+    finally:
+        close_drivers()
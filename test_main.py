@@ -0,0 +1,146 @@
+import pytest
+from selenium.webdriver.common.by import By
+
+from main import (
+    MAX_PAGE_ELEMENTS, complete_guidance, extract_page_elements, get_locator,
+    parse_plan, tag_element
+)
+
+
+class FakeDriver:
+    # Answers CDP commands from canned responses and records every call
+    def __init__(self, responses):
+        self.responses = responses
+        self.calls = []
+
+    def execute_cdp_cmd(self, cmd, params):
+        self.calls.append((cmd, params))
+        return self.responses.get(cmd, {})
+
+
+def ax_node(backend_id, role='button', name='Go', **extra):
+    node = {
+        "nodeId": str(backend_id),
+        "backendDOMNodeId": backend_id,
+        "role": {"type": "role", "value": role},
+        "name": {"type": "computedString", "value": name},
+    }
+    node.update(extra)
+    return node
+
+
+def test_parse_plan_plain_json():
+    guidance = '[{"op": "CLICK", "arg": "#stays"}, {"op": "TYPE", "arg": "Seattle"}]'
+    assert parse_plan(guidance) == [('CLICK', '#stays'), ('TYPE', 'Seattle')]
+
+def test_parse_plan_fenced_json():
+    guidance = '```json\n[{"op": "click", "arg": "#search"}]\n```'
+    assert parse_plan(guidance) == [('CLICK', '#search')]
+
+def test_parse_plan_prose_before_json():
+    guidance = 'Here is the plan:\n[{"op": "WAIT", "arg": 2}, {"op": "DONE"}]'
+    assert parse_plan(guidance) == [('WAIT', '2'), ('DONE', '')]
+
+def test_parse_plan_skips_earlier_brackets():
+    guidance = 'Format is [{op, arg}]. Plan:\n[{"op": "DONE"}]'
+    assert parse_plan(guidance) == [('DONE', '')]
+
+def test_parse_plan_drops_only_malformed_actions():
+    guidance = '[{"op": "CLICK", "arg": "#a"}, {"arg": "x"}, {"op": "JUMP"}, "junk", {"op": "DONE"}]'
+    assert parse_plan(guidance) == [('CLICK', '#a'), ('DONE', '')]
+
+def test_parse_plan_single_command():
+    assert parse_plan('CLICK: //button[@id="go"]') == [('CLICK', '//button[@id="go"]')]
+
+def test_parse_plan_rejects_words_starting_with_an_op():
+    assert parse_plan('WAITING for page') == []
+    assert parse_plan('TYPEWRITER') == []
+
+def test_complete_guidance_waits_for_closed_array():
+    assert complete_guidance('```json\n[{"op": "CLICK", "arg": "#a"}') is None
+    assert complete_guidance('```json\n[{"op": "CLICK", "arg": "#a"}]\n``') == '```json\n[{"op": "CLICK", "arg": "#a"}]'
+
+def test_complete_guidance_ignores_text_after_plan():
+    text = 'Sure:\n[{"op": "DONE"}] and some more'
+    assert parse_plan(complete_guidance(text)) == [('DONE', '')]
+
+def stream_until_complete(reply, chunk_size=3):
+    # Feeds the reply in small chunks, as the Claude stream does, and returns
+    # the guidance along with how much of the reply was read
+    guidance = ""
+    for i in range(0, len(reply), chunk_size):
+        guidance += reply[i:i + chunk_size]
+        complete = complete_guidance(guidance)
+        if complete is not None:
+            return complete, len(guidance)
+    return None, len(guidance)
+
+def test_complete_guidance_stops_stream_after_earlier_bracket():
+    plan = 'Format is [{op, arg}]. Plan:\n[{"op": "CLICK", "arg": "42"}]'
+    reply = plan + '\nThis clicks the search button, then I will look again.'
+    guidance, read = stream_until_complete(reply)
+    assert parse_plan(guidance) == [('CLICK', '42')]
+    assert read < len(reply)
+    assert read <= len(plan) + 3
+
+def test_complete_guidance_single_command_needs_full_line():
+    assert complete_guidance('CLICK: #sea') is None
+    assert complete_guidance('CLICK: #search\nThen') == 'CLICK: #search'
+
+def test_get_locator_xpath():
+    assert get_locator('//a[@href]') == (By.XPATH, '//a[@href]')
+    assert get_locator('(//button)[2]') == (By.XPATH, '(//button)[2]')
+
+def test_get_locator_css():
+    assert get_locator('#search') == (By.CSS_SELECTOR, '#search')
+    assert get_locator('a[href="//cdn.example.com"]') == (By.CSS_SELECTOR, 'a[href="//cdn.example.com"]')
+
+def test_extract_page_elements_filters_nodes():
+    driver = FakeDriver({"Accessibility.getFullAXTree": {"nodes": [
+        ax_node(1, role='button', name='Search'),
+        ax_node(2, role='heading', name='Stays'),
+        ax_node(3, role='link', name=''),
+        ax_node(4, role='link', name='Hidden', ignored=True),
+        {"role": {"value": "button"}, "name": {"value": "No DOM node"}},
+        ax_node(5, role='textbox', name='Going to'),
+    ]}})
+    elements = extract_page_elements(driver)
+    assert [element["id"] for element in elements] == [1, 5]
+    assert elements[0] == {"id": 1, "role": "button", "name": "Search"}
+    # Extraction is a single read, the DOM is left untouched
+    assert [cmd for cmd, _ in driver.calls] == ["Accessibility.getFullAXTree"]
+
+def test_extract_page_elements_caps_element_count():
+    nodes = [ax_node(i) for i in range(1, MAX_PAGE_ELEMENTS + 50)]
+    driver = FakeDriver({"Accessibility.getFullAXTree": {"nodes": nodes}})
+    assert len(extract_page_elements(driver)) == MAX_PAGE_ELEMENTS
+
+def test_extract_page_elements_includes_value_and_state():
+    driver = FakeDriver({"Accessibility.getFullAXTree": {"nodes": [
+        ax_node(7, role='combobox', name='Going to',
+                value={"type": "string", "value": "Seattle"},
+                properties=[
+                    {"name": "focused", "value": {"type": "booleanOrUndefined", "value": True}},
+                    {"name": "expanded", "value": {"type": "booleanOrUndefined", "value": False}},
+                    {"name": "editable", "value": {"type": "token", "value": "plaintext"}},
+                ]),
+        ax_node(8, role='checkbox', name='Free cancellation', value={"type": "string", "value": ""},
+                properties=[{"name": "checked", "value": {"type": "tristate", "value": "true"}}]),
+    ]}})
+    assert extract_page_elements(driver) == [
+        {"id": 7, "role": "combobox", "name": "Going to", "value": "Seattle",
+         "focused": True, "expanded": False},
+        {"id": 8, "role": "checkbox", "name": "Free cancellation", "checked": "true"},
+    ]
+
+def test_tag_element_marks_only_the_chosen_node():
+    driver = FakeDriver({"DOM.pushNodesByBackendIdsToFrontend": {"nodeIds": [31]}})
+    assert tag_element(driver, "42") == '[data-bot-id="42"]'
+    assert driver.calls[-1] == ("DOM.setAttributeValue", {"nodeId": 31, "name": "data-bot-id", "value": "42"})
+    assert [cmd for cmd, _ in driver.calls].count("DOM.setAttributeValue") == 1
+
+def test_tag_element_skips_missing_node():
+    driver = FakeDriver({"DOM.pushNodesByBackendIdsToFrontend": {"nodeIds": [0]}})
+    with pytest.raises(ValueError):
+        tag_element(driver, "42")
+    assert "DOM.setAttributeValue" not in [cmd for cmd, _ in driver.calls]